@@ -1,26 +1,49 @@
 import logging
 import uuid
-from typing import Any  # noqa: UP035
+from contextlib import asynccontextmanager
+from typing import Annotated, Any  # noqa: UP035
 
 import socketio
 from celery.result import AsyncResult
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse, Response
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 
 from sloppy.celery_app import app as celery_app
-from sloppy.db.script_model import Script, ScriptRepository, ScriptState
-from sloppy.script_gen.tasks import generate_news_script
-from sloppy.upload_tt.tasks import upload_tiktok
+from sloppy.db.script_model import (
+    SCRIPT_LIST_ADAPTER,
+    Script,
+    ScriptRepository,
+    ScriptState,
+)
+from sloppy.socketio_manager import AsyncTaskRoomRedisManager, OrjsonJSON
 from sloppy.utils import load_envs
-from sloppy.video_prod.tasks import generate_video
 
 load_envs()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+# Drop the Socket.IO libraries' per-packet chatter at the logger, not the formatter
+logging.getLogger("socketio").setLevel(logging.WARNING)
+logging.getLogger("engineio").setLevel(logging.WARNING)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One shared MongoDB connection pool for every request
+    app.state.script_repo = ScriptRepository(maxPoolSize=20, minPoolSize=5)
+    yield
+    app.state.script_repo.close()
+
 
-app = FastAPI(title="Sloppy API", version="1.0.0")
+app = FastAPI(
+    title="Sloppy API",
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
+)
 
 # Add CORS middleware
 app.add_middleware(
@@ -39,9 +62,10 @@ sio = socketio.AsyncServer(
     cors_allowed_origins=[
         "http://localhost:3000",
     ],
-    logger=True,
-    # Use Redis as the message queue directly
-    client_manager=socketio.AsyncRedisManager("redis://redis:6379/0"),
+    # Use Redis as the message queue directly, with one channel per task room
+    client_manager=AsyncTaskRoomRedisManager("redis://redis:6379/0"),
+    # Encode/decode Socket.IO and Engine.IO packets with orjson
+    json=OrjsonJSON,
 )
 
 
@@ -56,33 +80,48 @@ async def connect(sid, environ):
 
 @sio.event
 async def disconnect(sid):
-    print(f"Client disconnected: {sid}")
+    logger.debug("Client disconnected: %s", sid)
 
 
 @sio.event
 async def join_task_room(sid, data):  # Remove 'environ' parameter
     """Join a room to receive updates for a specific task"""
     task_id = data.get("task_id")
-    logger.info(f"🔗 Client {sid} joining room: task_{task_id}")
     if task_id:
         await sio.enter_room(sid, f"task_{task_id}")
         await sio.emit("joined_room", {"task_id": task_id}, room=sid)
-        logger.info(f"✅ Client {sid} successfully joined room: task_{task_id}")
+        logger.debug("✅ Client %s joined room: task_%s", sid, task_id)
+
+
+@sio.event
+async def join_task_rooms(sid, data):
+    """Join the rooms for several tasks at once (e.g. after a reconnect)"""
+    task_ids = data.get("task_ids")
+    if not isinstance(task_ids, list):
+        # A string would otherwise be joined one character at a time
+        return
+    task_ids = [task_id for task_id in task_ids if task_id]
+    await sio.manager.enter_rooms(sid, "/", [f"task_{task_id}" for task_id in task_ids])
+    await sio.emit("joined_rooms", {"task_ids": task_ids}, room=sid)
+    logger.debug("✅ Client %s joined %d task rooms", sid, len(task_ids))
 
 
 @sio.event
 async def leave_task_room(sid, data):  # Remove 'environ' parameter
     """Leave a task room"""
     task_id = data.get("task_id")
-    logger.info(f"🚪 Client {sid} leaving room: task_{task_id}")
     if task_id:
         await sio.leave_room(sid, f"task_{task_id}")
         await sio.emit("left_room", {"task_id": task_id}, room=sid)
-        logger.info(f"✅ Client {sid} successfully left room: task_{task_id}")
+        logger.debug("🚪 Client %s left room: task_%s", sid, task_id)
 
 
-# Initialize repository
-script_repo = ScriptRepository()
+# Repository dependency
+async def get_repo(request: Request) -> ScriptRepository:
+    return request.app.state.script_repo
+
+
+Repo = Annotated[ScriptRepository, Depends(get_repo)]
 
 
 # Request models
@@ -112,23 +151,35 @@ class ScriptUpdateRequest(BaseModel):
 
 
 # Health check endpoint
-@app.get("/health")
+@app.get("/health", response_class=PlainTextResponse)
 async def health_check():
-    return {"status": "healthy"}
+    return "healthy"
 
 
 # Database health check
+DB_HEALTHY_BODY = b'{"status":"healthy","database":"connected"}'
+
+
 @app.get("/health/db")
-async def db_health_check():
-    if script_repo.test_connection():
-        return {"status": "healthy", "database": "connected"}
+async def db_health_check(script_repo: Repo):
+    if await run_in_threadpool(script_repo.test_connection):
+        return Response(content=DB_HEALTHY_BODY, media_type="application/json")
     else:
         raise HTTPException(status_code=503, detail="Database connection failed")
 
 
 # Celery task endpoints
+# Tasks are dispatched by name so the API never imports the worker-side
+# modules (LangGraph agents, MoviePy, ...) just to enqueue them
+GENERATE_SCRIPT_TASK = "sloppy.script_gen.tasks.generate_news_script"
+GENERATE_VIDEO_TASK = "sloppy.video_prod.tasks.generate_video"
+UPLOAD_TIKTOK_TASK = "sloppy.upload_tt.tasks.upload_tiktok"
+
+
 @app.post("/tasks/generate-script")
-async def create_script_generation_task(request: ScriptGenerationRequest):
+async def create_script_generation_task(
+    request: ScriptGenerationRequest, script_repo: Repo
+):
     """Create a new script generation task"""
     try:
         # Generate unique task ID
@@ -141,10 +192,12 @@ async def create_script_generation_task(request: ScriptGenerationRequest):
             state=ScriptState.GENERATING,
             active_task_id=task_id,
         )
-        script_repo.create_script(script)
+        await run_in_threadpool(script_repo.create_script, script)
 
         # Start Celery task with custom task ID
-        generate_news_script.apply_async(args=[request.topic], task_id=task_id)  # type: ignore
+        celery_app.send_task(
+            GENERATE_SCRIPT_TASK, args=[request.topic], task_id=task_id
+        )
 
         return {"task_id": task_id, "topic": request.topic}
     except Exception as e:
@@ -152,81 +205,133 @@ async def create_script_generation_task(request: ScriptGenerationRequest):
 
 
 @app.post("/tasks/generate-video")
-async def create_video_generation_task(request: VideoGenerationRequest):
+async def create_video_generation_task(
+    request: VideoGenerationRequest, script_repo: Repo
+):
     """Create a new video generation task"""
     try:
-        task = generate_video.delay(request.script_id, request.script, request.settings)  # type: ignore
-        script_repo.update_script(
+        # Mark the script before dispatch so a fast failure can't be overwritten
+        task_id = str(uuid.uuid4())
+        await run_in_threadpool(
+            script_repo.update_script,
             request.script_id,
-            {"state": ScriptState.PRODUCING, "active_task_id": task.id},
+            {"state": ScriptState.PRODUCING, "active_task_id": task_id},
+        )
+        celery_app.send_task(
+            GENERATE_VIDEO_TASK,
+            args=[request.script_id, request.script, request.settings],
+            task_id=task_id,
         )
         return {
-            "task_id": task.id,
+            "task_id": task_id,
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
 
 
 @app.post("/tasks/upload-tiktok")
-async def create_tiktok_upload_task(request: TikTokUploadRequest):
+async def create_tiktok_upload_task(request: TikTokUploadRequest, script_repo: Repo):
     """Create a new TikTok upload task"""
     try:
-        task = upload_tiktok.delay(  # type: ignore
-            request.script_id, request.video_path, request.metadata
-        )  # type: ignore
-        script_repo.update_script(
+        # Mark the script before dispatch so a fast failure can't be overwritten
+        task_id = str(uuid.uuid4())
+        await run_in_threadpool(
+            script_repo.update_script,
             request.script_id,
-            {"state": ScriptState.UPLOADING, "active_task_id": task.id},
+            {"state": ScriptState.UPLOADING, "active_task_id": task_id},
+        )
+        celery_app.send_task(
+            UPLOAD_TIKTOK_TASK,
+            args=[request.script_id, request.video_path, request.metadata],
+            task_id=task_id,
         )
-        return {"task_id": task.id}
+        return {"task_id": task_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
 
 
 # Task status endpoints
+FINISHED_TASK_CACHE_SIZE = 1024
+_finished_task_statuses: dict[str, dict[str, Any]] = {}
+
+
+def read_task_status(task_id: str) -> tuple[dict[str, Any], bool]:
+    """Read a task's status from the result backend; also says if it's final"""
+    result = AsyncResult(task_id, app=celery_app)
+    state = result.state  # each access re-reads the backend until ready
+
+    if state == "PENDING":
+        return {"task_id": task_id, "status": "pending", "result": None}, False
+    elif state == "SUCCESS":
+        status = {"task_id": task_id, "status": "success", "result": result.result}
+        return status, True
+    elif state == "FAILURE":
+        error = str(result.info)
+        return {"task_id": task_id, "status": "failure", "error": error}, True
+    else:
+        return {"task_id": task_id, "status": state, "result": result.info}, False
+
+
 @app.get("/tasks/{task_id}/status")
 async def get_task_status(task_id: str):
     """Get the status of a Celery task"""
     try:
-        result = AsyncResult(task_id, app=celery_app)
-
-        if result.state == "PENDING":
-            return {"task_id": task_id, "status": "pending", "result": None}
-        elif result.state == "SUCCESS":
-            return {"task_id": task_id, "status": "success", "result": result.result}
-        elif result.state == "FAILURE":
-            return {"task_id": task_id, "status": "failure", "error": str(result.info)}
-        else:
-            return {"task_id": task_id, "status": result.state, "result": result.info}
+        # Finished tasks never change state, so repeat polls skip Redis
+        if task_id in _finished_task_statuses:
+            return _finished_task_statuses[task_id]
+
+        status, finished = await run_in_threadpool(read_task_status, task_id)
+        if not finished:
+            return status
+
+        if len(_finished_task_statuses) >= FINISHED_TASK_CACHE_SIZE:
+            # Evict the oldest entry (dicts keep insertion order)
+            del _finished_task_statuses[next(iter(_finished_task_statuses))]
+        _finished_task_statuses[task_id] = status
+        return status
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
 
 
 # Script CRUD endpoints
+# Studio view shows everything that hasn't been uploaded yet
+STUDIO_STATES = [s.value for s in ScriptState if s != ScriptState.UPLOADED]
+
+
+# List responses are serialized straight to JSON bytes by pydantic-core
+def scripts_response(scripts: list[Script]) -> Response:
+    return Response(
+        SCRIPT_LIST_ADAPTER.dump_json(scripts), media_type="application/json"
+    )
+
+
 @app.post("/scripts", response_model=str)
-async def create_script(script: Script):
+async def create_script(script: Script, script_repo: Repo):
     """Create a new script"""
     try:
-        script_id = script_repo.create_script(script)
+        script_id = await run_in_threadpool(script_repo.create_script, script)
         return script_id
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
 
 
-@app.get("/scripts/studio-scripts", response_model=list[Script])
-async def studio_scripts():
+@app.get("/scripts/studio-scripts")
+async def studio_scripts(script_repo: Repo):
     try:
-        scripts = script_repo.get_scripts_not_in_state(ScriptState.UPLOADED)
-        return scripts
+        # The studio list never shows the script body; the modal refetches it
+        scripts = await run_in_threadpool(
+            script_repo.get_scripts_in_states, STUDIO_STATES, summary=True
+        )
+        return scripts_response(scripts)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
 
 
-@app.get("/scripts/{script_id}", response_model=Script)
-async def get_script(script_id: str):
+@app.get("/scripts/{script_id}", response_model=Script, response_model_by_alias=False)
+async def get_script(script_id: str, script_repo: Repo):
     """Get a script by ID"""
     try:
-        script = script_repo.get_script(script_id)
+        script = await run_in_threadpool(script_repo.get_script, script_id)
         if not script:
             raise HTTPException(status_code=404, detail="Script not found")
         return script
@@ -237,16 +342,19 @@ async def get_script(script_id: str):
 
 
 @app.put("/scripts/{script_id}")
-async def update_script(script_id: str, request: ScriptUpdateRequest):
+async def update_script(
+    script_id: str, request: ScriptUpdateRequest, script_repo: Repo
+):
     """Update a script"""
     try:
-        # Filter out None values
-        update_data = {k: v for k, v in request.dict().items() if v is not None}
+        update_data = request.model_dump(exclude_none=True)
 
         if not update_data:
             raise HTTPException(status_code=400, detail="No update data provided")
 
-        success = script_repo.update_script(script_id, update_data)
+        success = await run_in_threadpool(
+            script_repo.update_script, script_id, update_data
+        )
         if not success:
             raise HTTPException(status_code=404, detail="Script not found")
 
@@ -258,10 +366,10 @@ async def update_script(script_id: str, request: ScriptUpdateRequest):
 
 
 @app.delete("/scripts/{script_id}")
-async def delete_script(script_id: str):
+async def delete_script(script_id: str, script_repo: Repo):
     """Delete a script"""
     try:
-        success = script_repo.delete_script(script_id)
+        success = await run_in_threadpool(script_repo.delete_script, script_id)
         if not success:
             raise HTTPException(status_code=404, detail="Script not found")
 
@@ -272,22 +380,28 @@ async def delete_script(script_id: str):
         raise HTTPException(status_code=500, detail=str(e)) from e
 
 
-@app.get("/scripts", response_model=list[Script])
-async def list_scripts():
+@app.get("/scripts")
+async def list_scripts(script_repo: Repo):
     """List all scripts"""
     try:
-        scripts = script_repo.get_all_scripts()
-        return scripts
+        scripts = await run_in_threadpool(script_repo.get_all_scripts)
+        return scripts_response(scripts)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
 
 
-@app.get("/scripts/state/{state}", response_model=list[Script])
-async def list_scripts_by_state(state: ScriptState):
-    """List scripts by state"""
+@app.get("/scripts/state/{state}")
+async def list_scripts_by_state(
+    state: ScriptState,
+    script_repo: Repo,
+    limit: Annotated[int | None, Query(ge=1, le=200)] = None,
+):
+    """List the scripts in a state, newest first (optionally only the newest N)"""
     try:
-        scripts = script_repo.get_scripts_by_state(state)
-        return scripts
+        scripts = await run_in_threadpool(
+            script_repo.get_scripts_by_state, state, limit
+        )
+        return scripts_response(scripts)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
 
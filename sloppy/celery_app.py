@@ -5,12 +5,29 @@ app = Celery("ai_tt_generator")
 app.config_from_object(
     {
         "broker_url": "redis://localhost:6379/0",
-        "result_backend": "redis://localhost:6379/0",
+        # Polling backend (celery-redis-poll): results are read with GET instead
+        # of a pub/sub SUBSCRIBE per submitted task
+        "result_backend": "redis+poll://localhost:6379/0",
         "task_serializer": "json",
         "accept_content": ["json"],
         "result_serializer": "json",
         "timezone": "UTC",
         "enable_utc": True,
+        # Tasks are long-running and I/O-bound: reserve one at a time so an idle
+        # worker can pick up queued jobs. Acks stay early: the tasks call paid
+        # APIs and aren't idempotent, so a redelivery would pay twice
+        "worker_prefetch_multiplier": 1,
+        # Redis runs next to the workers: fail fast on a dead connection instead
+        # of waiting out the long defaults, and keep idle sockets alive
+        "broker_connection_timeout": 2,
+        "broker_transport_options": {"socket_keepalive": True},
+        "redis_socket_connect_timeout": 2,
+        "redis_socket_keepalive": True,
+        "redis_retry_on_timeout": True,
+        # Ride out a Redis blip when storing or reading a result, but give up
+        # after a few attempts (backoff between them is capped at 10 s)
+        "result_backend_always_retry": True,
+        "result_backend_max_retries": 5,
         "imports": (
             "sloppy.script_gen.tasks",
             "sloppy.upload_tt.tasks",
@@ -67,15 +67,12 @@ export function useWebSocket({
       console.log("✅ WebSocket connected");
       setIsConnected(true);
 
-      // Rejoin all active task rooms after reconnection
-      activeTasksRef.current.forEach((taskId) => {
-        if (socketToUse != null) {
-          console.log(`🔄 Rejoining task room: ${taskId}`);
-          socketToUse.emit("join_task_room", { task_id: taskId });
-        } else {
-          console.error("Socket null");
-        }
-      });
+      // Rejoin all active task rooms after reconnection in a single event
+      const taskIds = Array.from(activeTasksRef.current);
+      if (taskIds.length > 0) {
+        console.log(`🔄 Rejoining task rooms: ${taskIds.join(", ")}`);
+        socketToUse.emit("join_task_rooms", { task_ids: taskIds });
+      }
 
       onConnect?.();
     });
@@ -105,6 +102,10 @@ export function useWebSocket({
       console.log("🚪 Joined task room:", data.task_id);
     });
 
+    socketToUse.on("joined_rooms", (data: { task_ids: string[] }) => {
+      console.log("🚪 Joined task rooms:", data.task_ids);
+    });
+
     // eslint-disable-next-line @typescript-eslint/no-explicit-any
     socketToUse.on("left_room", (data: { task_id: any }) => {
       console.log("🚪 Left task room:", data.task_id);
@@ -146,6 +147,7 @@ export function useWebSocket({
     socket.off("connected");
     socket.off("task_update");
     socket.off("joined_room");
+    socket.off("joined_rooms");
     socket.off("left_room");
     socket.offAny(); // Remove the onAny listener too
 
@@ -248,6 +250,7 @@ export function useWebSocket({
         socket.off("connected");
         socket.off("task_update");
         socket.off("joined_room");
+        socket.off("joined_rooms");
         socket.off("left_room");
         socket.offAny();
       }
@@ -1,10 +1,12 @@
+import functools
 import logging
 import os
+from datetime import UTC, datetime
 from enum import IntEnum
 from typing import Any
 
-from pydantic import BaseModel, Field
-from pymongo import MongoClient
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
+from pymongo import DESCENDING, MongoClient
 from pymongo.collection import Collection
 
 from sloppy.utils import load_envs
@@ -27,7 +29,9 @@ class ScriptState(IntEnum):
 class Script(BaseModel):
     """Pydantic model for script documents"""
 
-    id: str = Field(description="Primary key - matches celery task ID")
+    model_config = ConfigDict(use_enum_values=True, populate_by_name=True)
+
+    id: str = Field(alias="_id", description="Primary key - matches celery task ID")
     user_prompt: str = Field(description="User's original prompt")
     script: str | None = Field(default=None, description="Generated script content")
     script_cost: float | None = Field(default=0.0, description="Cost of generation")
@@ -41,44 +45,61 @@ class Script(BaseModel):
     active_task_id: str | None = Field(
         default=None, description="ID of currently active task for this script"
     )
-
-    class Config:
-        use_enum_values = True
-        json_encoders = {ScriptState: lambda v: v.value}
+    created_at: datetime | None = Field(
+        default=None, description="Insertion time, set by the repository"
+    )
 
     def to_mongo_dict(self) -> dict[str, Any]:
-        """Convert to MongoDB document format"""
-        data = self.dict()
-        data["_id"] = data.pop("id")  # Use custom ID as MongoDB _id
-        return data
+        """Convert to MongoDB document format (id is stored as _id)"""
+        return self.model_dump(exclude_none=True, by_alias=True)
 
     @classmethod
     def from_mongo_dict(cls, data: dict[str, Any]) -> "Script":
         """Create Script instance from MongoDB document"""
-        if "_id" in data:
-            data["id"] = data.pop("_id")
+        return cls.model_validate(data)
+
+
+# Validates a whole list of Mongo documents in one pydantic-core call
+SCRIPT_LIST_ADAPTER = TypeAdapter(list[Script])
 
-        return cls(**data)
+# Drops the (potentially long) generated script text from list queries
+SUMMARY_PROJECTION = {"script": 0}
 
 
 class ScriptRepository:
     """Repository class for Script CRUD operations"""
 
-    def __init__(self, mongo_uri: str = "", database_name: str = ""):
+    # Index creation is a server round-trip; only do it once per database
+    _indexed_databases: set[tuple[str, str]] = set()
+
+    def __init__(
+        self, mongo_uri: str = "", database_name: str = "", **client_options: Any
+    ):
         load_envs()
         self.mongo_uri = mongo_uri or os.getenv("MONGODB_URI", "")
         self.database_name = database_name or os.getenv("DATABASE_NAME", "")
 
-        self.client = MongoClient(self.mongo_uri)
+        # tz_aware so created_at (stored as UTC) reads back as an aware datetime
+        self.client = MongoClient(self.mongo_uri, tz_aware=True, **client_options)
         self.db = self.client[self.database_name]
         self.collection: Collection = self.db.scripts
 
-        # Create index on state for efficient filtering
-        self.collection.create_index("state")
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        """Create the collection indexes once per process and database"""
+        key = (self.mongo_uri, self.database_name)
+        if key in ScriptRepository._indexed_databases:
+            return
+        # Compound index serves state filters and newest-first list views
+        self.collection.create_index([("state", 1), ("created_at", DESCENDING)])
+        ScriptRepository._indexed_databases.add(key)
 
     def create_script(self, script: Script) -> Script:
         """Insert a new script document"""
         doc = script.to_mongo_dict()
+        if doc.get("created_at") is None:
+            doc["created_at"] = datetime.now(UTC)
         res = self.collection.insert_one(doc)
         return res.inserted_id
 
@@ -101,25 +122,55 @@ class ScriptRepository:
             return True
         return False
 
+    def update_and_clear_active_task(
+        self, script_id: str, update_data: dict[str, Any]
+    ) -> bool:
+        """Update a script document and clear its active_task_id in one write"""
+        if "state" in update_data and isinstance(update_data["state"], ScriptState):
+            update_data["state"] = update_data["state"].value
+
+        result = self.collection.update_one(
+            {"_id": script_id},
+            {"$set": update_data, "$unset": {"active_task_id": ""}},
+        )
+        return result.modified_count > 0
+
     def delete_script(self, script_id: str) -> bool:
         """Delete a script by ID"""
         result = self.collection.delete_one({"_id": script_id})
         return result.deleted_count > 0
 
-    def get_scripts_by_state(self, state: ScriptState) -> list[Script]:
-        """Get all scripts with a specific state"""
-        docs = self.collection.find({"state": state.value})
-        return [Script.from_mongo_dict(doc) for doc in docs]
+    def get_scripts_by_state(
+        self, state: ScriptState, limit: int | None = None
+    ) -> list[Script]:
+        """Get the scripts with a specific state, newest first
 
-    def get_scripts_not_in_state(self, state: ScriptState) -> list[Script]:
-        """Get all scripts that are NOT in a specific state"""
-        docs = self.collection.find({"state": {"$ne": state.value}})
-        return [Script.from_mongo_dict(doc) for doc in docs]
+        With a limit, only that many of the newest scripts are returned.
+        """
+        docs = self.collection.find({"state": state.value}).sort(
+            "created_at", DESCENDING
+        )
+        if limit is not None:
+            docs = docs.limit(limit)
+        return SCRIPT_LIST_ADAPTER.validate_python(list(docs))
+
+    def get_scripts_in_states(
+        self, states: list[int], summary: bool = False
+    ) -> list[Script]:
+        """Get all scripts in any of the given states
+
+        With summary=True the script body is left out (script is None), for
+        list views that fetch the full script only when one is opened.
+        """
+        # $in over explicit states is an index range scan; $ne scans the collection
+        projection = SUMMARY_PROJECTION if summary else None
+        docs = self.collection.find({"state": {"$in": states}}, projection)
+        return SCRIPT_LIST_ADAPTER.validate_python(list(docs))
 
     def get_all_scripts(self) -> list[Script]:
         """Get all scripts"""
         docs = self.collection.find()
-        return [Script.from_mongo_dict(doc) for doc in docs]
+        return SCRIPT_LIST_ADAPTER.validate_python(list(docs))
 
     def clear_active_task(self, script_id: str) -> bool:
         """Clear the active_task_id for a script"""
@@ -134,9 +185,15 @@ class ScriptRepository:
             self.client.admin.command("ping")
             return True
         except Exception as e:
-            print(f"Database connection failed: {e}")
+            logger.error(f"Database connection failed: {e}")
             return False
 
     def close(self):
         """Close the MongoDB connection"""
         self.client.close()
+
+
+@functools.cache
+def get_script_repository() -> ScriptRepository:
+    """Shared ScriptRepository (and MongoClient pool) for this process"""
+    return ScriptRepository()
@@ -1,112 +1,107 @@
 import logging
-from concurrent.futures import ThreadPoolExecutor
+import uuid
 
-from sloppy.db.script_model import Script, ScriptRepository, ScriptState
+from sloppy.db.script_model import Script, ScriptState, get_script_repository
 from sloppy.script_gen.tasks import generate_news_script
 from sloppy.video_prod.tasks import generate_video
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-script_mongo = ScriptRepository()
-if script_mongo.test_connection():
-    print("✅☘️ MongoDB Connected Succesfully!")
-else:
-    print("❌ Failed to Connect")
+__all__ = ["TaskManager", "task_manager"]
 
 
 class TaskManager:
-    def __init__(self, max_workers=5):
-        self.executor = ThreadPoolExecutor(
-            max_workers=max_workers, thread_name_prefix="task_handler"
-        )
-        self.futures = []
-
-    def cleanup_completed_futures(self):
-        logger.info("CLEANUP CALLED")
-        self.futures = [f for f in self.futures if not f.done()]
-        if len(self.futures) == 0:
-            logger.info("CLEANUP TRUE")
+    def __init__(self):
+        # Celery already tracks task state in the result backend, so keep the
+        # AsyncResults themselves and finalize them once they are ready
+        self.tasks = []  # (AsyncResult, completion handler) pairs
+
+    def cleanup_completed_tasks(self):
+        """Finalize finished tasks; returns True once none are outstanding"""
+        logger.debug("CLEANUP CALLED")
+        pending = []
+        for task, handle_completion in self.tasks:
+            if task.ready():
+                handle_completion(task)
+            else:
+                pending.append((task, handle_completion))
+        self.tasks = pending
+        if len(self.tasks) == 0:
+            logger.debug("CLEANUP TRUE")
             return True
         else:
-            logger.info("CLEANUP FALSE")
+            logger.debug("CLEANUP FALSE")
             return False
 
     def new_script_task(self, choice):
-        script_task = generate_news_script.apply_async(args=(choice,))  # type: ignore
-        script_obj = Script(
-            id=script_task.id, user_prompt=choice, state=ScriptState.GENERATING
+        # Create the script in DB before the task can report back on it
+        task_id = str(uuid.uuid4())
+        get_script_repository().create_script(
+            Script(
+                id=task_id,
+                user_prompt=choice,
+                state=ScriptState.GENERATING,
+                active_task_id=task_id,
+            )
         )
-        # Submit to thread pool
-        future = self.executor.submit(handle_script_task, script_task, script_obj)
-        self.futures.append(future)
+        script_task = generate_news_script.apply_async(  # type: ignore
+            args=(choice,), task_id=task_id
+        )
+        # Drop finished tasks as we go so the list only holds in-flight ones
+        self.cleanup_completed_tasks()
+        self.tasks.append((script_task, handle_script_completion))
 
-        return future
+        return script_task
 
     def new_video_task(self, script_id):
-        script_obj = script_mongo.get_script(script_id)
+        script_obj = get_script_repository().get_script(script_id)
         if not script_obj:
             raise FileNotFoundError("Script Not Found")
+        # Mark the script before dispatch so a fast failure can't be overwritten
+        task_id = str(uuid.uuid4())
+        get_script_repository().update_script(
+            script_obj.id,
+            {"state": ScriptState.PRODUCING, "active_task_id": task_id},
+        )
         video_task = generate_video.apply_async(  # type: ignore
             args=(
+                script_obj.id,
                 script_obj.script,
                 {},
-            )
+            ),
+            task_id=task_id,
         )
-        future = self.executor.submit(handle_video_task, video_task, script_obj)
-        self.futures.append(future)
+        self.cleanup_completed_tasks()
+        self.tasks.append((video_task, handle_video_completion))
 
-        return future
+        return video_task
 
 
-def handle_script_task(script_task, script_obj):
+def handle_script_completion(script_task):
     try:
-        # Create initial script in DB
-        script_mongo.create_script(script_obj)
+        # Task is ready, so this returns immediately
+        result = script_task.get(propagate=False)
 
-        # Poll task
-        while not script_task.ready():
-            continue
-
-        # Get the result
-        result = script_task.result
-
-        # Check if task actually succeeded
-        if not result.get("success", False):
-            logger.error(
-                f"Task failed with error: {result.get('error', 'Unknown error')}"
-            )
+        # Check if task actually succeeded (a failed task returns its exception)
+        if not isinstance(result, dict) or not result.get("success", False):
+            error = result.get("error") if isinstance(result, dict) else result
+            logger.error(f"Task failed with error: {error or 'Unknown error'}")
             return
 
-        # Extract data
-        script_content = result["script"]
-        cost = result["cost"]
-
-        # Update database
-        script_mongo.update_script(
-            script_task.id,
-            {
-                "script": script_content,
-                "state": ScriptState.GENERATED,
-                "cost": cost,
-            },
-        )
-
+        # generate_news_script already stored the script, state and cost
         logger.info("✅ Script task handling completed successfully")
 
     except Exception as e:
-        logger.error(f"❌ Error in handle_script_task: {e}")
-
+        logger.error(f"❌ Error in handle_script_completion: {e}")
 
-def handle_video_task(video_task, script_obj):
-    script_mongo.update_script(script_obj.id, {"state": ScriptState.PRODUCING})
 
-    while not video_task.ready():
-        continue
-    audio_filepath, video_filepath = video_task.result
-    script_mongo.update_script(
-        script_obj.id, {"audio_file": audio_filepath, "video_file": video_filepath}
-    )
+def handle_video_completion(video_task):
+    # generate_video stores the audio/video paths and state itself
+    if video_task.failed():
+        logger.error(f"❌ Video task failed: {video_task.result}")
+    else:
+        logger.info("✅ Video task handling completed successfully")
 
 
 task_manager = TaskManager()
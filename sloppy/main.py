@@ -1,95 +1,15 @@
 #!/usr/bin/env python3
-import os
-from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from dotenv import load_dotenv
 from rich.console import Console
 from rich.panel import Panel
 from rich.text import Text
 
-from sloppy.db.script_model import Script, ScriptRepository, ScriptState
-from sloppy.script_gen.tasks import generate_news_script
-from sloppy.video_prod.tasks import generate_video
+from sloppy.db.script_model import get_script_repository
+from sloppy.db_manager import task_manager
+from sloppy.utils import load_envs
 
-"""
-Script/video task management
-"""
-
-env_path = Path(__file__).parent.parent / ".env"
-load_dotenv(env_path)
-print(f"OPENAI_API_KEY loaded: {'OPENAI_API_KEY' in os.environ}")
-
-script_mongo = ScriptRepository()
-if script_mongo.test_connection():
-    print("✅☘️ MongoDB Connected Succesfully!")
-else:
-    print("❌ Failed to Connect")
-
-
-class TaskManager:
-    def __init__(self, max_workers=5):
-        self.executor = ThreadPoolExecutor(
-            max_workers=max_workers, thread_name_prefix="task_handler"
-        )
-        self.futures = []
-
-    def new_script_task(self, choice):
-        script_task = generate_news_script.apply_async(args=(choice,))  # type: ignore
-        script_obj = Script(
-            id=script_task.id, user_prompt=choice, state=ScriptState.GENERATING
-        )
-        # Submit to thread pool
-        future = self.executor.submit(handle_script_task, script_task, script_obj)
-        self.futures.append(future)
-
-        return future
-
-    def new_video_task(self, script_id):
-        script_obj = script_mongo.get_script(script_id)
-        if not script_obj:
-            raise FileNotFoundError("Script Not Found")
-        video_task = generate_video.apply_async(  # type: ignore
-            args=(
-                script_obj.script,
-                {},
-            )
-        )
-        future = self.executor.submit(handle_video_task, video_task, script_obj)
-        self.futures.append(future)
-
-        return future
-
-
-def handle_script_task(script_task, script_obj):
-    # Create initial script in DB
-    script_mongo.create_script(script_obj)
-
-    # Poll task
-    while not script_task.ready():
-        continue
-    script_mongo.update_script(
-        script_task.id,
-        {
-            "script": script_task.result.script,
-            "state": ScriptState.GENERATED,
-            "cost": script_task.result.cost,
-        },
-    )
-
-
-def handle_video_task(video_task, script_obj):
-    script_mongo.update_script(script_obj.id, {"state": ScriptState.PRODUCING})
-
-    while not video_task.ready():
-        continue
-    audio_filepath, video_filepath = video_task.result
-    script_mongo.update_script(
-        script_obj.id, {"audio_file": audio_filepath, "video_file": video_filepath}
-    )
-
-
-task_manager = TaskManager()
+ENV_PATH = Path(__file__).parent.parent / ".env"
 
 """
 Terminal UI for task generation
@@ -97,34 +17,46 @@ Terminal UI for task generation
 
 console = Console()
 
+# Static panels, built once and reprinted on every redraw
+HEADER_PANEL = Panel(Text("AI TT Generator", style="bold blue", justify="center"))
+MAIN_MENU_PANEL = Panel(
+    """1 - Generate Script
+2 - Generate Video
+q - Quit""",
+    title="Main Menu",
+)
+SUBMENU_PANELS = {
+    option: Panel(
+        f"""Selected: {option}
+
+    b - Back""",
+        title=option,
+    )
+    for option in ("Generate Script", "Generate Video")
+}
+
 
 def clear_screen():
     """Clear the screen"""
-    os.system("clear" if os.name == "posix" else "cls")
+    console.clear()
 
 
 def show_main_menu():
     """Show main menu and get user choice"""
+    needs_redraw = True  # the menu only changes after returning from a submenu
     while True:
-        clear_screen()
+        if needs_redraw:
+            clear_screen()
 
-        # Header
-        console.print(
-            Panel(Text("AI TT Generator", style="bold blue", justify="center"))
-        )
+            # Header
+            console.print(HEADER_PANEL)
 
-        # Menu
-        console.print(
-            Panel(
-                """1 - Generate Script
-2 - Generate Video
-q - Quit""",
-                title="Main Menu",
-            )
-        )
+            # Menu
+            console.print(MAIN_MENU_PANEL)
 
         choice = input("\nEnter choice: ").strip().lower()
 
+        needs_redraw = True
         if choice == "1":
             show_submenu("Generate Script")
         elif choice == "2":
@@ -133,8 +65,9 @@ q - Quit""",
             console.print("\n[green]Goodbye![/green]")
             break
         else:
-            console.print("\n[red]Invalid choice. Press Enter to continue...[/red]")
-            input()
+            # Re-prompt below the menu that is still on screen
+            console.print("\n[red]Invalid choice.[/red]")
+            needs_redraw = False
 
 
 def show_submenu(option):
@@ -145,19 +78,10 @@ def show_submenu(option):
             clear_screen()
 
             # Header
-            console.print(
-                Panel(Text("AI TT Generator", style="bold blue", justify="center"))
-            )
+            console.print(HEADER_PANEL)
 
             # Submenu
-            console.print(
-                Panel(
-                    f"""Selected: {option}
-
-    b - Back""",
-                    title=option,
-                )
-            )
+            console.print(SUBMENU_PANELS[option])
 
         choice = input("\nEnter choice: ").strip().lower()
 
@@ -178,8 +102,18 @@ def show_submenu(option):
 
 
 def main():
+    load_envs(ENV_PATH)
+
+    # Connect on startup rather than at import so importing this module is cheap
+    if get_script_repository().test_connection():
+        print("✅☘️ MongoDB Connected Succesfully!")
+    else:
+        print("❌ Failed to Connect")
+
     try:
         show_main_menu()
+        # Tasks keep running on the workers; just finalize the ones already done
+        task_manager.cleanup_completed_tasks()
     except KeyboardInterrupt:
         console.print("\n[red]Interrupted by user[/red]")
 
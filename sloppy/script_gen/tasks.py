@@ -1,51 +1,40 @@
 import asyncio
-import traceback
-import uuid
+import functools
+import logging
+import re
+from dataclasses import dataclass
 from typing import Any, TypedDict
 
+from celery.signals import worker_init
 from langchain_community.callbacks.manager import get_openai_callback
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
 from langfuse import get_client
 from langfuse.langchain import CallbackHandler
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import END, START, StateGraph
 from open_deep_research.multi_agent import supervisor_builder
-from pydantic import BaseModel, Field
 
 from sloppy.celery_app import app
-from sloppy.db.script_model import ScriptRepository, ScriptState
+from sloppy.db.script_model import ScriptState, get_script_repository
 from sloppy.socketio_client import emit_task_completed, emit_task_failed
 from sloppy.utils import load_envs
 
-# DB Connection
-script_mongo = ScriptRepository()
-if script_mongo.test_connection():
-    print("✅☘️ MongoDB Connected Succesfully!")
-else:
-    print("❌ Failed to Connect")
+logger = logging.getLogger(__name__)
 
 
-# Define structured output schema for the script
-class ScriptLine(BaseModel):
-    speaker: str = Field(
-        description="Either 'Speaker 1:' or 'Speaker 2:' to identify the speaker"
-    )
-    line_content: str = Field(description="The actual content/dialogue for this line")
-
+# One dialogue line: speaker tag at the start of a line, then non-empty content
+SCRIPT_LINE_RE = re.compile(r"^[^\S\n]*Speaker ([12]):[^\S\n]*(.*\S)", re.MULTILINE)
+# Shared speaker tag strings, looked up by the single captured digit
+SPEAKER_TAGS = {"1": "Speaker 1:", "2": "Speaker 2:"}
 
-class PodcastScript(BaseModel):
-    title: str = Field(description="Title of the podcast episode")
-    topic: str = Field(description="Main topic being discussed")
-    script_lines: list[ScriptLine] = Field(
-        description="List of dialogue lines between the two speakers"
-    )
 
-    def to_formatted_script(self) -> str:
-        """Convert structured script to the desired Speaker 1:/Speaker 2: format"""
-        formatted_lines = []
-        for line in self.script_lines:
-            formatted_lines.append(f"{line.speaker} {line.line_content}")
-        return "\n".join(formatted_lines)
+# One parsed dialogue line; a plain slotted dataclass since it is only built
+# from already-parsed strings, never from untrusted input
+@dataclass(slots=True, frozen=True)
+class ScriptLine:
+    speaker: str  # Either 'Speaker 1:' or 'Speaker 2:' to identify the speaker
+    line_content: str  # The actual content/dialogue for this line
 
 
 # Define our custom state
@@ -58,120 +47,150 @@ class ScriptGenerationState(TypedDict):
 
 def extract_structured_script(state: ScriptGenerationState) -> dict[str, Any]:
     """Extract script from the last AIMessage"""
-    print("🎬 Extracting script from state...")
+    logger.debug("🎬 Extracting script from state...")
 
     messages = state.get("messages", [])
-    print(f"   Found {len(messages)} messages in state")
+    logger.debug(f"Found {len(messages)} messages in state")
 
-    # Get the last AIMessage (this is where the script always is)
-    for message in reversed(messages):
-        if (
-            isinstance(message, AIMessage)
-            and message.content
-            and ("Speaker 1:" in message.content or "Speaker 2:" in message.content)
-        ):
-            content = message.content
-            print(f"   Found script in AIMessage (length: {len(content)} chars)")
-
-            # Parse into structured format
-            script_lines = []
-            lines = content.split("\n")  # type: ignore
-
-            for line in lines:
-                line = line.strip()
-                if line.startswith("Speaker 1:") or line.startswith("Speaker 2:"):
-                    speaker = (
-                        "Speaker 1:" if line.startswith("Speaker 1:") else "Speaker 2:"
-                    )
-                    line_content = line[
-                        len(speaker) :
-                    ].strip()  # Remove 'Speaker 1:' or 'Speaker 2:'
-                    if line_content:
-                        script_lines.append(
-                            ScriptLine(speaker=speaker, line_content=line_content)
-                        )
-
-            if len(script_lines) >= 10:
-                print(f"   ✅ Successfully parsed {len(script_lines)} script lines")
-                formatted_script = PodcastScript(
-                    title="NewsBreak Podcast",
-                    topic="Current News",
-                    script_lines=script_lines,
-                ).to_formatted_script()
-
-                return {
-                    "final_script": formatted_script,
-                    "script_ready": True,
-                    "cost": state.get("cost", 0.0),
-                }
+    # Get the last AIMessage (this is where the script always is); older
+    # messages are research and tool output, so don't scan back through them
+    message = next(
+        (m for m in reversed(messages) if isinstance(m, AIMessage) and m.content),
+        None,
+    )
+    if message is not None and isinstance(message.content, str):
+        content = message.content
+        logger.debug(f"Found last AIMessage (length: {len(content)} chars)")
+
+        # Parse into structured format in one regex pass over the content
+        script_lines = [
+            ScriptLine(
+                speaker=SPEAKER_TAGS[match.group(1)], line_content=match.group(2)
+            )
+            for match in SCRIPT_LINE_RE.finditer(content)
+        ]
+
+        if len(script_lines) >= 10:
+            logger.info(f"✅ Successfully parsed {len(script_lines)} script lines")
+            # Back to the Speaker 1:/Speaker 2: format, one line each
+            formatted_script = "\n".join(
+                f"{line.speaker} {line.line_content}" for line in script_lines
+            )
+
+            return {
+                "final_script": formatted_script,
+                "script_ready": True,
+                "cost": state.get("cost", 0.0),
+            }
 
     # If we get here, no script found
-    print("   ❌ No script found in messages!")
+    logger.error("❌ No script found in messages!")
     return {"final_script": None, "script_ready": False, "cost": state.get("cost", 0.0)}
 
 
 # Agent setup
-print("🔧 Setting up agent...")
 checkpointer = MemorySaver()
+# Research agent settings shared by every run; only the thread_id varies
+AGENT_CONFIGURABLE = {
+    "search_api": "tavily",
+    "supervisor_model": "openai:o1",
+    "researcher_model": "openai:o1",
+}
 
-try:
-    # Compile the original agent
+
+@functools.cache
+def get_original_agent():
+    """Compiled open_deep_research supervisor, built once per process"""
     original_agent = supervisor_builder.compile(
         name="news_researcher", checkpointer=checkpointer
     )
-    print(f"   Original agent compiled: {type(original_agent)}")
+    logger.debug(f"Original agent compiled: {type(original_agent)}")
+    return original_agent
 
-    async def call_original_agent(state: ScriptGenerationState) -> dict[str, Any]:
-        """Call original agent and extract results from state"""
-        print("🤖 Calling original agent...")
 
-        messages = state.get("messages", [])
-        input_dict = {"messages": messages}
+async def call_original_agent(
+    state: ScriptGenerationState, config: RunnableConfig
+) -> dict[str, Any]:
+    """Call original agent and extract results from state"""
+    logger.info("🤖 Calling original agent...")
 
-        config = {
-            "configurable": {
-                "thread_id": str(uuid.uuid4()),
-                "search_api": "tavily",
-                "supervisor_model": "openai:o1",
-                "researcher_model": "openai:o1",
-            }
-        }
+    original_agent = get_original_agent()
+    messages = state.get("messages", [])
+    input_dict = {"messages": messages}
+
+    # Derived from the wrapper's thread (the Celery task id) so traces correlate
+    thread_id = f"{config['configurable']['thread_id']}:research"
+    agent_config = {"configurable": {**AGENT_CONFIGURABLE, "thread_id": thread_id}}
 
-        # Call agent (always returns None)
+    # Call agent (always returns None)
+    try:
         with get_openai_callback() as cb:
-            await original_agent.ainvoke(input_dict, config=config)  # type: ignore
+            await original_agent.ainvoke(input_dict, config=agent_config)  # type: ignore
 
             # Extract results from state (this is where the actual results are)
-            final_state = original_agent.get_state(config)  # type: ignore
+            final_state = original_agent.get_state(agent_config)  # type: ignore
             result = final_state.values
 
-            print(
-                f"   ✅ Agent completed, extracted {len(result['messages'])} "
+            logger.info(
+                f"✅ Agent completed, extracted {len(result['messages'])} "
                 "messages from state"
             )
 
             return {"messages": result["messages"], "cost": cb.total_cost}
+    finally:
+        # Each run uses a fresh thread; drop its checkpoints so the
+        # long-lived worker's MemorySaver doesn't keep every past run
+        checkpointer.delete_thread(thread_id)
+
+
+@functools.cache
+def get_agent():
+    """Compiled wrapper graph (research agent -> script extraction)"""
+    logger.debug("🔧 Setting up agent...")
+    try:
+        # Create the wrapper graph
+        wrapper_graph = StateGraph(ScriptGenerationState)
+        wrapper_graph.add_node("call_agent", call_original_agent)
+        wrapper_graph.add_node("extract_script", extract_structured_script)
+        wrapper_graph.add_edge(START, "call_agent")
+        wrapper_graph.add_edge("call_agent", "extract_script")
+        wrapper_graph.add_edge("extract_script", END)
+
+        # Compile the wrapper (and the agent it calls). The wrapper runs once per
+        # task and is never resumed, so it doesn't need a checkpointer
+        get_original_agent()
+        agent = wrapper_graph.compile()
+        logger.debug(f"Wrapper agent compiled: {list(agent.nodes.keys())}")
+        return agent
+
+    except Exception as e:
+        logger.error(f"❌ Error compiling agent: {e}")
+        raise
+
 
-    # Create the wrapper graph
-    wrapper_graph = StateGraph(ScriptGenerationState)
-    wrapper_graph.add_node("call_agent", call_original_agent)
-    wrapper_graph.add_node("extract_script", extract_structured_script)
-    wrapper_graph.add_edge(START, "call_agent")
-    wrapper_graph.add_edge("call_agent", "extract_script")
-    wrapper_graph.add_edge("extract_script", END)
+@worker_init.connect
+def compile_agent_before_fork(**kwargs):
+    """Compile in the worker's main process so every forked child inherits it"""
+    get_agent()
 
-    # Compile the wrapper
-    agent = wrapper_graph.compile(checkpointer=checkpointer)
-    print(f"   Wrapper agent compiled: {list(agent.nodes.keys())}")
 
-except Exception as e:
-    print(f"❌ Error compiling agent: {e}")
-    raise
+@functools.cache
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Event loop reused by every task run in this worker process.
 
+    asyncio.run() would close the loop after each task, taking the HTTP
+    client connection pools opened on it (OpenAI, Tavily) down with it. Only
+    ever first called from inside a task, so the loop is created after fork.
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    return loop
 
-# Script generation task
-langfuse_client = get_client()
-langfuse_handler = CallbackHandler()
+
+@functools.cache
+def get_langfuse_handler() -> CallbackHandler:
+    """Langfuse tracing handler, created after the task has loaded the .env"""
+    return CallbackHandler()
 
 
 @app.task(bind=True)
@@ -179,11 +198,14 @@ def generate_news_script(self, topic):
     """Generate news script"""
     load_envs()
     task_id = self.request.id
-    print(f"\n🚀 Starting script generation for topic: {topic}")
+    script_mongo = get_script_repository()
+    logger.info(f"🚀 Starting script generation for topic: {topic}")
 
     langfuse = get_client()
     script_gen_prompt = langfuse.get_prompt("script-gen").prompt
-    print(f"✅ Script-gen prompt fetched from Langfuse: {script_gen_prompt}")
+    logger.debug(
+        f"✅ Script-gen prompt fetched from Langfuse ({len(script_gen_prompt)} chars)"
+    )
 
     messages = [
         SystemMessage(content=script_gen_prompt),
@@ -195,18 +217,18 @@ def generate_news_script(self, topic):
     input_dict = {"messages": messages, "final_script": None, "script_ready": False}
 
     async def run_async():
+        # The Celery task id is already unique per run
         config = {
-            "configurable": {"thread_id": str(uuid.uuid4())},
-            "callbacks": [langfuse_handler],
+            "configurable": {"thread_id": task_id},
+            "callbacks": [get_langfuse_handler()],
         }
-        response = await asyncio.wait_for(
-            agent.ainvoke(input_dict, config=config),  # type: ignore
-            timeout=300,
-        )
+        agent = get_agent()
+        async with asyncio.timeout(300):
+            response = await agent.ainvoke(input_dict, config=config)  # type: ignore
         return response
 
     try:
-        result = asyncio.run(run_async())
+        result = get_event_loop().run_until_complete(run_async())
         if (
             result
             and result.get("script_ready")
@@ -215,26 +237,28 @@ def generate_news_script(self, topic):
         ):
             script = result["final_script"]
             cost = result["cost"]
-            response_dict = {
-                "script": script,
-                "state": ScriptState.GENERATED,
-                "script_cost": cost,
-                "success": True,
-            }
-            print(f"✅ Script generated: {len(script)} characters")
-            script_mongo.update_script(
+            logger.info(f"✅ Script generated: {len(script)} characters")
+            script_mongo.update_and_clear_active_task(
                 task_id,
-                response_dict,
+                {
+                    "script": script,
+                    "state": ScriptState.GENERATED,
+                    "script_cost": cost,
+                },
             )
-            script_mongo.clear_active_task(task_id)
             emit_task_completed(task_id)
-            return response_dict
+            # The script itself lives in Mongo; keep the Celery result small
+            return {
+                "task_id": task_id,
+                "success": True,
+                "script_length": len(script),
+                "script_cost": cost,
+            }
         else:
-            emit_task_failed(task_id, "ValueError - Script generation failed")
+            # The handler below clears the active task and emits the failure
             raise ValueError("Script generation failed")
     except Exception as e:
-        print(f"❌ Error: {e}")
-        traceback.print_exc()
+        logger.exception(f"❌ Script generation failed for topic {topic!r}: {e}")
         script_mongo.clear_active_task(task_id)
         emit_task_failed(task_id, f"SCRIPT_GENERATION_FAILED: {str(e)}")
         raise
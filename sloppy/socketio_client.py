@@ -1,33 +1,46 @@
 # sloppy/socketio_client.py
-import socketio
+import functools
+import logging
 
-# Use synchronous RedisManager with write_only=True
-redis_manager = socketio.RedisManager("redis://redis:6379/0", write_only=True)
+from sloppy.socketio_manager import TaskRoomRedisManager
+
+logger = logging.getLogger(__name__)
+
+
+@functools.cache
+def get_redis_manager() -> TaskRoomRedisManager:
+    """Write-only RedisManager publishing per task room, created on first emit"""
+    return TaskRoomRedisManager(
+        "redis://redis:6379/0",
+        write_only=True,
+        redis_options={"socket_keepalive": True},
+    )
 
 
 def emit_task_completed(task_id: str):
     """Emit task completion"""
     try:
-        redis_manager.emit(
+        get_redis_manager().emit(
             "task_update",
             {"task_id": task_id, "type": "completed"},
             room=f"task_{task_id}",
         )
-        print(f"✅ Emitted completion for task {task_id}")
+        logger.info(f"✅ Emitted completion for task {task_id}")
     except Exception as e:
-        print(f"❌ Failed to emit completion: {e}")
-        print(f"   Task ID: {task_id}")
-        print(f"   Room: task_{task_id}")
+        logger.error(
+            f"❌ Failed to emit completion: {e} "
+            f"(task ID: {task_id}, room: task_{task_id})"
+        )
 
 
 def emit_task_failed(task_id: str, error: str):
     """Emit task failure"""
     try:
-        redis_manager.emit(
+        get_redis_manager().emit(
             "task_update",
             {"task_id": task_id, "type": "failed", "error": error},
             room=f"task_{task_id}",
         )
-        print(f"✅ Emitted failure for task {task_id}")
+        logger.info(f"✅ Emitted failure for task {task_id}")
     except Exception as e:
-        print(f"❌ Failed to emit failure: {e}")
+        logger.error(f"❌ Failed to emit failure: {e}")
@@ -0,0 +1,178 @@
+# sloppy/socketio_manager.py
+import asyncio
+import logging
+import pickle
+
+import orjson
+import socketio
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+TASK_ROOM_PREFIX = "task_"
+
+
+class OrjsonJSON:
+    """Drop-in json module for python-socketio packet encoding, backed by orjson"""
+
+    @staticmethod
+    def dumps(obj, **kwargs) -> str:
+        # orjson output is already compact, so separators= is not needed
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    @staticmethod
+    def loads(s, **kwargs):
+        return orjson.loads(s)
+
+
+def room_channel(channel: str, data: dict) -> str:
+    """Pick the Redis channel a pub/sub message is published on.
+
+    Emits to a task room go to a per-room channel (``socketio#task_<id>``) so
+    only API instances with a client in that room receive them. Everything
+    else (disconnects, room changes, callbacks, broadcasts) stays on the
+    shared channel every instance listens to.
+    """
+    room = data.get("room")
+    if (
+        data.get("method") == "emit"
+        and isinstance(room, str)
+        and room.startswith(TASK_ROOM_PREFIX)
+    ):
+        return f"{channel}#{room}"
+    return channel
+
+
+class TaskRoomRedisManager(socketio.RedisManager):
+    """Write-only Redis manager that publishes task room emits per room"""
+
+    # Mirrors RedisManager._publish from python-socketio 5.13 (pinned in
+    # pyproject), changing only the channel; re-check it when upgrading
+    def _publish(self, data):
+        channel = room_channel(self.channel, data)
+        retry = True
+        while True:
+            try:
+                if not retry:
+                    self._redis_connect()
+                return self.redis.publish(channel, pickle.dumps(data))
+            except RedisError:
+                if retry:
+                    logger.error("Cannot publish to redis... retrying")
+                    retry = False
+                else:
+                    logger.error("Cannot publish to redis... giving up")
+                    break
+
+
+class AsyncTaskRoomRedisManager(socketio.AsyncRedisManager):
+    """Redis manager that only subscribes to task rooms with local clients"""
+
+    def __init__(self, *args, **kwargs):
+        self.room_channels: set[str] = set()
+        super().__init__(*args, **kwargs)
+
+    # Mirrors AsyncRedisManager._publish from python-socketio 5.13 (pinned in
+    # pyproject), changing only the channel; re-check it when upgrading
+    async def _publish(self, data):
+        channel = room_channel(self.channel, data)
+        retry = True
+        while True:
+            try:
+                if not retry:
+                    self._redis_connect()
+                return await self.redis.publish(channel, pickle.dumps(data))
+            except RedisError:
+                if retry:
+                    self._get_logger().error("Cannot publish to redis... retrying")
+                    retry = False
+                else:
+                    self._get_logger().error("Cannot publish to redis... giving up")
+                    break
+
+    async def _sync_room_channels(self):
+        """Subscribe to newly occupied task rooms and drop emptied ones"""
+        if self.write_only:
+            return
+        wanted = {
+            f"{self.channel}#{room}"
+            for rooms in self.rooms.values()
+            for room in rooms
+            if isinstance(room, str) and room.startswith(TASK_ROOM_PREFIX)
+        }
+        added = wanted - self.room_channels
+        removed = self.room_channels - wanted
+        self.room_channels = wanted
+        try:
+            if added:
+                await self.pubsub.subscribe(*added)
+            if removed:
+                await self.pubsub.unsubscribe(*removed)
+        except RedisError:
+            # The listener resubscribes to self.room_channels on reconnect
+            self._get_logger().error("Cannot update room subscriptions")
+
+    async def enter_room(self, sid, namespace, room, eio_sid=None):
+        await super().enter_room(sid, namespace, room, eio_sid=eio_sid)
+        await self._sync_room_channels()
+
+    async def enter_rooms(self, sid, namespace, rooms):
+        """Add a client to several rooms with a single SUBSCRIBE for them all"""
+        for room in rooms:
+            await super().enter_room(sid, namespace, room)
+        await self._sync_room_channels()
+
+    async def leave_room(self, sid, namespace, room):
+        await super().leave_room(sid, namespace, room)
+        await self._sync_room_channels()
+
+    async def disconnect(self, sid, namespace, **kwargs):
+        await super().disconnect(sid, namespace, **kwargs)
+        await self._sync_room_channels()
+
+    async def close_room(self, room, namespace=None):
+        await super().close_room(room, namespace=namespace)
+        await self._sync_room_channels()
+
+    # Room changes relayed from other hosts call AsyncManager directly and
+    # bypass the overrides above, so resync after those too
+    async def _handle_enter_room(self, message):
+        await super()._handle_enter_room(message)
+        await self._sync_room_channels()
+
+    async def _handle_leave_room(self, message):
+        await super()._handle_leave_room(message)
+        await self._sync_room_channels()
+
+    async def _handle_close_room(self, message):
+        await super()._handle_close_room(message)
+        await self._sync_room_channels()
+
+    # Mirrors AsyncRedisManager._redis_listen_with_retries from python-socketio
+    # 5.13 (pinned in pyproject), adding the task room channels on resubscribe.
+    # Room messages are relabelled with the shared channel so the stock
+    # _listen() filter passes them through.
+    async def _redis_listen_with_retries(self):
+        channel = self.channel.encode("utf-8")
+        room_prefix = channel + b"#"
+        retry_sleep = 1
+        connect = False
+        while True:
+            try:
+                if connect:
+                    self._redis_connect()
+                    await self.pubsub.subscribe(self.channel, *self.room_channels)
+                    retry_sleep = 1
+                async for message in self.pubsub.listen():
+                    if message["type"] == "message" and message["channel"].startswith(
+                        room_prefix
+                    ):
+                        message["channel"] = channel
+                    yield message
+            except RedisError:
+                self._get_logger().error(
+                    f"Cannot receive from redis... retrying in {retry_sleep} secs"
+                )
+                connect = True
+                await asyncio.sleep(retry_sleep)
+                retry_sleep = min(retry_sleep * 2, 60)
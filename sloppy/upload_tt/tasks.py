@@ -1,23 +1,22 @@
 from sloppy.celery_app import app
-from sloppy.db.script_model import ScriptRepository, ScriptState
+from sloppy.db.script_model import ScriptState, get_script_repository
 from sloppy.socketio_client import emit_task_completed, emit_task_failed
 
-# DB Connection
-script_mongo = ScriptRepository()
-
 
 @app.task(bind=True)
 def upload_tiktok(self, script_id, video_path, metadata):
     """Upload to TikTok task - to be implemented"""
     task_id = self.request.id
+    script_mongo = get_script_repository()
 
     try:
         # TODO: Implement actual TikTok upload logic here
         # For now, just simulate completion
 
         # Update script state to uploaded
-        script_mongo.update_script(script_id, {"state": ScriptState.UPLOADED})
-        script_mongo.clear_active_task(script_id)
+        script_mongo.update_and_clear_active_task(
+            script_id, {"state": ScriptState.UPLOADED}
+        )
 
         emit_task_completed(task_id)
 
@@ -29,8 +28,9 @@ def upload_tiktok(self, script_id, video_path, metadata):
         }
     except Exception as e:
         # Revert state on failure
-        script_mongo.update_script(script_id, {"state": ScriptState.PRODUCED})
-        script_mongo.clear_active_task(script_id)
+        script_mongo.update_and_clear_active_task(
+            script_id, {"state": ScriptState.PRODUCED}
+        )
 
         emit_task_failed(task_id, str(e))
 
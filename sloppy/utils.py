@@ -1,15 +1,32 @@
+import logging
 import os
 from pathlib import Path
 
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
+ENV_PATH = Path("/app/.env")
+REQUIRED_ENV_KEYS = ("OPENAI_API_KEY", "TAVILY_API_KEY", "FAL_KEY")
+
+# mtime of each .env file when it was last loaded (None if it was missing)
+_env_mtimes: dict[Path, float | None] = {}
+
 
 # Load environment variables
-def load_envs():
-    env_path = Path("/app/.env")
+def load_envs(env_path: Path = ENV_PATH):
+    """Load a .env file into the environment, re-parsing only when it changed"""
+    try:
+        mtime = env_path.stat().st_mtime
+    except FileNotFoundError:
+        mtime = None
+    if env_path in _env_mtimes and _env_mtimes[env_path] == mtime:
+        return
+    _env_mtimes[env_path] = mtime
+
     load_dotenv(env_path, override=True)
 
     # Checking keys
-    print(f"OPENAI_API_KEY loaded: {'OPENAI_API_KEY' in os.environ}")
-    print(f"TAVILY_API_KEY loaded: {'TAVILY_API_KEY' in os.environ}")
-    print(f"FAL_KEY loaded: {'FAL_KEY' in os.environ}")
+    for key in REQUIRED_ENV_KEYS:
+        if key not in os.environ:
+            logger.warning(f"{key} not set after loading {env_path}")
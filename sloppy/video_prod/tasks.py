@@ -1,28 +1,60 @@
+import functools
+import io
 import logging
 import os
-import tempfile
-import traceback
+import subprocess
+import time
 from datetime import datetime
 
+import av
 import fal_client
 import requests
 from langfuse import get_client, observe
-from moviepy import AudioFileClip, VideoFileClip
+from requests.adapters import HTTPAdapter, Retry
 
 from sloppy.celery_app import app
-from sloppy.db.script_model import ScriptRepository, ScriptState
+from sloppy.db.script_model import ScriptState, get_script_repository
 from sloppy.socketio_client import emit_task_completed, emit_task_failed
 from sloppy.utils import load_envs
 
 logger = logging.getLogger(__name__)
 
-script_repository = ScriptRepository()
 langfuse = get_client()
 
+TTS_MODEL = "fal-ai/playai/tts/dialog"
+TTS_COST_PER_MINUTE = 0.05
+# Constant part of the TTS generation metadata, merged with per-call values
+TTS_METADATA = {"provider": "fal-ai", "cost_per_minute": TTS_COST_PER_MINUTE}
+
+
+@functools.cache
+def get_http_session() -> requests.Session:
+    """Pooled HTTP session for audio downloads, reused across tasks in a worker"""
+    session = requests.Session()
+    session.mount(
+        "https://",
+        HTTPAdapter(
+            pool_connections=8,
+            pool_maxsize=32,
+            max_retries=Retry(total=3, backoff_factor=0.3),
+        ),
+    )
+    return session
+
+
+@functools.cache
+def get_ffmpeg_binary() -> str:
+    """ffmpeg executable resolved by MoviePy (the bundled imageio-ffmpeg build)"""
+    # Imported on first use: moviepy pulls in numpy, imageio and its ffmpeg
+    # checks, which every process importing the tasks module would pay for
+    from moviepy.config import FFMPEG_BINARY
+
+    return FFMPEG_BINARY
+
 
 @observe(name="tts_generation")
 def generate_audio_from_text(text_content: str) -> tuple[str, float]:
-    generation_start_time = datetime.now()
+    generation_start_time = time.perf_counter()
 
     def on_queue_update(update):
         if hasattr(update, "logs"):
@@ -31,7 +63,7 @@ def generate_audio_from_text(text_content: str) -> tuple[str, float]:
 
     # Use the correct endpoint and subscribe pattern
     tts_result = fal_client.subscribe(
-        "fal-ai/playai/tts/dialog",
+        TTS_MODEL,
         arguments={"input": text_content},
         with_logs=True,
         on_queue_update=on_queue_update,
@@ -41,55 +73,66 @@ def generate_audio_from_text(text_content: str) -> tuple[str, float]:
     audio_url = tts_result["audio"]["url"]
     audio_duration_seconds = tts_result["audio"].get("duration", 0)
     audio_duration_minutes = audio_duration_seconds / 60.0
-    estimated_cost_dollars = 0.05 * audio_duration_minutes
-    processing_duration_seconds = (
-        datetime.now() - generation_start_time
-    ).total_seconds()
+    estimated_cost_dollars = TTS_COST_PER_MINUTE * audio_duration_minutes
+    processing_duration_seconds = time.perf_counter() - generation_start_time
 
     logger.info("TTS Cost Calculation:")
     logger.info(
         f"  - Duration: {audio_duration_seconds} seconds"
         f" ({audio_duration_minutes:.4f} minutes)"
     )
-    logger.info("  - Cost per minute: $0.05")
+    logger.info(f"  - Cost per minute: ${TTS_COST_PER_MINUTE}")
     logger.info(f"  - Estimated cost: ${estimated_cost_dollars:.4f}")
     logger.info(f"  - Processing time: {processing_duration_seconds:.2f} seconds")
 
     langfuse.update_current_generation(
-        model="fal-ai/playai/tts/dialog",
+        model=TTS_MODEL,
         input=text_content,
         output=f"Generated audio at {audio_url}",
         cost_details={"total": estimated_cost_dollars},
         usage_details={"audio_duration_seconds": audio_duration_seconds},
         metadata={
-            "provider": "fal-ai",
+            **TTS_METADATA,
             "processing_time_seconds": processing_duration_seconds,
             "audio_duration_seconds": audio_duration_seconds,
-            "cost_per_minute": 0.05,
         },
     )
     return audio_url, estimated_cost_dollars
 
 
+def probe_duration(media) -> float:
+    """Duration in seconds from the container header, without decoding"""
+    with av.open(media) as container:
+        if container.duration is None:
+            raise ValueError("Container has no duration")
+        return container.duration / av.time_base
+
+
+@functools.lru_cache(maxsize=1)
+def probe_source_video(video_path: str, mtime: float) -> float:
+    """Source video duration, re-probed only when the file's mtime changes"""
+    return probe_duration(video_path)
+
+
 def generate_video_from_audio(audio_file_url: str, task_id: str) -> tuple[bool, str]:
     try:
-        # Download audio file to a temp file
-        with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tmp_audio:
-            audio_response = requests.get(audio_file_url, stream=True)
+        # Download audio into memory (a few MB at most); the with block returns
+        # the connection to the pool even on an early return
+        with get_http_session().get(audio_file_url, stream=True) as audio_response:
             if audio_response.status_code != 200:
                 logger.error(f"Failed to download audio: {audio_file_url}")
                 return False, ""
-            for chunk in audio_response.iter_content(chunk_size=8192):
-                tmp_audio.write(chunk)
-            audio_path = tmp_audio.name
+            audio_buffer = io.BytesIO()
+            for chunk in audio_response.iter_content(chunk_size=1 << 16):
+                audio_buffer.write(chunk)
 
-        # Load audio and get duration
+        # Get duration from the in-memory header
         try:
-            audio_clip = AudioFileClip(audio_path)
-            audio_duration = audio_clip.duration
+            audio_buffer.seek(0)
+            audio_duration = probe_duration(audio_buffer)
             logger.info(f"Successfully loaded audio duration: {audio_duration} seconds")
         except Exception as e:
-            logger.error(f"Failed to load audio clip: {e}")
+            logger.error(f"Failed to read audio duration: {e}")
             return False, ""
 
         # Load source video (surf.mp4 in same dir as this file)
@@ -98,40 +141,17 @@ def generate_video_from_audio(audio_file_url: str, task_id: str) -> tuple[bool,
             logger.error(f"Source video not found: {video_path}")
             return False, ""
         try:
-            video_clip = VideoFileClip(video_path)
-            logger.info(f"Successfully loaded duration: {video_clip.duration} seconds")
+            video_duration = probe_source_video(
+                video_path, os.path.getmtime(video_path)
+            )
+            logger.info(f"Successfully loaded duration: {video_duration} seconds")
         except Exception as e:
             logger.error(f"Failed to load video clip: {e}")
             return False, ""
 
         # Trim video to audio duration
-        try:
-            trim_duration = min(audio_duration, video_clip.duration)
-            logger.info(f"Trimming video to duration: {trim_duration} seconds")
-            trimmed_video = video_clip.subclipped(0, trim_duration)
-            logger.info("Successfully created trimmed video clip")
-        except Exception as e:
-            logger.error(f"Failed to trim video: {e}")
-            return False, ""
-
-        # Set audio - ensure audio clip is properly loaded
-        if audio_clip is not None:
-            try:
-                logger.info("Attempting to set audio on video clip")
-                logger.info(f"trimmed_video type: {type(trimmed_video)}")
-                logger.info(f"audio_clip type: {type(audio_clip)}")
-                # Use the correct method name for MoviePy v2.0+
-                final_video = trimmed_video.with_audio(audio_clip)
-                logger.info("Successfully set audio on video clip")
-            except AttributeError as e:
-                logger.error(f"with_audio method not found: {e}")
-                return False, ""
-            except Exception as e:
-                logger.error(f"Failed to set audio on video clip: {e}")
-                return False, ""
-        else:
-            logger.error("Audio clip is None, cannot set audio")
-            return False, ""
+        trim_duration = min(audio_duration, video_duration)
+        logger.info(f"Trimming video to duration: {trim_duration} seconds")
 
         # Output path
         av_path = os.getenv("AV_PATH")
@@ -140,28 +160,45 @@ def generate_video_from_audio(audio_file_url: str, task_id: str) -> tuple[bool,
             return False, ""
         output_path = os.path.join(av_path, f"{task_id}.mp4")
 
-        # Write the video file
+        # Write the video file: copy the source video stream untouched and only
+        # encode the audio, which ffmpeg reads from stdin
         try:
             logger.info(f"Writing video file to: {output_path}")
-            final_video.write_videofile(
-                output_path, codec="libx264", audio_codec="aac", threads=2, logger=None
+            subprocess.run(
+                [
+                    get_ffmpeg_binary(),
+                    "-y",
+                    "-loglevel",
+                    "error",
+                    "-i",
+                    video_path,
+                    "-i",
+                    "pipe:0",
+                    "-t",
+                    f"{trim_duration:.3f}",
+                    "-map",
+                    "0:v:0",
+                    "-map",
+                    "1:a:0",
+                    "-c:v",
+                    "copy",
+                    "-c:a",
+                    "aac",
+                    "-shortest",
+                    output_path,
+                ],
+                input=audio_buffer.getvalue(),
+                capture_output=True,
+                check=True,
             )
             logger.info("Successfully wrote video file")
-        except Exception as e:
-            logger.error(f"Failed to write video file: {e}")
+        except subprocess.CalledProcessError as e:
+            logger.error(f"Failed to write video file: {e.stderr.decode().strip()}")
             return False, ""
 
-        # Cleanup
-        audio_clip.close()
-        video_clip.close()
-        trimmed_video.close()
-        final_video.close()
-        os.remove(audio_path)
         return True, output_path
     except Exception as e:
-        logger.error(
-            f"Error in generate_video_from_audio: {e}\n{traceback.format_exc()}"
-        )
+        logger.exception(f"Error in generate_video_from_audio: {e}")
         return False, ""
 
 
@@ -172,6 +209,8 @@ def generate_video(
 ):
     celery_task_id = self.request.id
     load_envs()
+    # Created on first use inside the forked worker process, then reused
+    script_repository = get_script_repository()
 
     # Determine generation mode
     audio_only = generation_settings.get("audio_only", False)
@@ -210,24 +249,18 @@ def generate_video(
                 audio_file_url, celery_task_id
             )
             if video_success:
-                script_repository.update_script(
+                script_repository.update_and_clear_active_task(
                     script_identifier,
                     {
                         "video_file": video_file_path,
                         "state": ScriptState.PRODUCED,
                     },
                 )
-                script_repository.clear_active_task(script_identifier)
                 emit_task_completed(celery_task_id)
                 return True
             else:
-                error_message = "Video generation failed"
-                script_repository.update_script(
-                    script_identifier, {"state": ScriptState.GENERATED}
-                )
-                script_repository.clear_active_task(script_identifier)
-                emit_task_failed(celery_task_id, error_message)
-                raise RuntimeError(error_message)
+                # The handler below reverts the state and emits the failure
+                raise RuntimeError("Video generation failed")
 
         # Handle audio generation (for both audio-only and both modes)
         audio_file_url = None
@@ -260,13 +293,12 @@ def generate_video(
 
         # Handle audio-only mode
         if audio_only:
-            script_repository.update_script(
+            script_repository.update_and_clear_active_task(
                 script_identifier,
                 {
                     "state": ScriptState.PRODUCED,
                 },
             )
-            script_repository.clear_active_task(script_identifier)
             emit_task_completed(celery_task_id)
             return True
 
@@ -276,37 +308,27 @@ def generate_video(
                 audio_file_url, celery_task_id
             )
             if video_success:
-                script_repository.update_script(
+                script_repository.update_and_clear_active_task(
                     script_identifier,
                     {
                         "video_file": video_file_path,
                         "state": ScriptState.PRODUCED,
                     },
                 )
-                script_repository.clear_active_task(script_identifier)
                 emit_task_completed(celery_task_id)
                 return True
             else:
-                error_message = "Video generation failed"
-                langfuse.update_current_span(
-                    output={"error": error_message, "success": False}, level="ERROR"
-                )
-                script_repository.update_script(
-                    script_identifier, {"state": ScriptState.GENERATED}
-                )
-                script_repository.clear_active_task(script_identifier)
-                emit_task_failed(celery_task_id, error_message)
-                raise RuntimeError(error_message)
+                # The handler below reverts the state and emits the failure
+                raise RuntimeError("Video generation failed")
 
     except Exception as task_error:
         error_message = str(task_error)
-        traceback.print_exc()
+        logger.exception(f"❌ Video generation failed for {script_identifier}")
         langfuse.update_current_span(
             output={"error": error_message, "success": False}, level="ERROR"
         )
-        script_repository.update_script(
+        script_repository.update_and_clear_active_task(
             script_identifier, {"state": ScriptState.GENERATED}
         )
-        script_repository.clear_active_task(script_identifier)
         emit_task_failed(celery_task_id, error_message)
         raise